@@ -1,7 +1,6 @@
 import asyncio
 import os
 import time
-import av
 from dotenv import load_dotenv
 import random
 
@@ -10,106 +9,20 @@ from livekit import agents, rtc
 from livekit.agents import JobContext, WorkerOptions, cli, AutoSubscribe, stt
 from livekit.plugins import deepgram
 
+# Shared prompt playback and audio configuration
+from voice_common import (
+    AUDIO_FILES, SAMPLE_RATE, NUM_CHANNELS, AudioFilePlayer,
+    spawn_background, flush_background_tasks,
+)
+
 # Import our grievance processor
 from grievance_processor import GrievanceProcessor
 
 load_dotenv()
 
-# --- CONFIGURATION ---
-AUDIO_FILES = {
-    "greeting": "audio/greeting_new.mp3",
-    "closing": "audio/closing_new.mp3",
-    "early_exit": "audio/early_closing.mp3",
-    "probe_details": "audio/probe_details_short.mp3",
-    "ack_1": "audio/hmm.mp3",
-    "ack_2": "audio/i_see.mp3",
-    "ack_3": "audio/ohh_isit.mp3"
-}
-
-SAMPLE_RATE = 48000
-NUM_CHANNELS = 1
-FRAME_SIZE_SAMPLES = 480
-
 # Initialize the grievance processor
 grievance_processor = GrievanceProcessor(db_path="grievances.db")
 
-class AudioFilePlayer:
-    def __init__(self, source: rtc.AudioSource):
-        self.source = source
-        self._current_task = None
-        self.is_playing = False
-        self._cache = {}
-
-    def preload(self, files_dict):
-        """Pre-decode short audio files into memory."""
-        print("[INIT] Pre-loading short audio files...")
-        for key, path in files_dict.items():
-            if "ack" in key or "greeting" in key: 
-                try:
-                    self._cache[path] = list(self._decode_file(path))
-                    print(f"   -> Cached {path}")
-                except Exception as e:
-                    print(f"   -> Failed to cache {path}: {e}")
-
-    async def play(self, filename: str):
-        # Stop current audio
-        if self._current_task and not self._current_task.done():
-            self._current_task.cancel()
-            try:
-                await self._current_task
-            except asyncio.CancelledError:
-                pass
-
-        self.is_playing = True
-        
-        # Check cache vs disk
-        if filename in self._cache:
-            self._current_task = asyncio.create_task(self._stream_cached(filename))
-        else:
-            self._current_task = asyncio.create_task(self._stream_from_disk(filename))
-            
-        await self._current_task
-        self.is_playing = False
-
-    def _decode_file(self, filename):
-        """Generator that yields audio frames from a file."""
-        container = av.open(filename)
-        stream = container.streams.audio[0]
-        resampler = av.AudioResampler(format="s16", layout="mono", rate=SAMPLE_RATE)
-        buffer = bytearray()
-        
-        for frame in container.decode(stream):
-            for resampled_frame in resampler.resample(frame):
-                buffer.extend(resampled_frame.to_ndarray().tobytes())
-                while len(buffer) >= 960:
-                    yield buffer[:960]
-                    buffer = buffer[960:]
-        container.close()
-
-    async def _stream_cached(self, filename):
-        """Streams pre-loaded frames from memory."""
-        frames = self._cache[filename]
-        for chunk_data in frames:
-            lk_frame = rtc.AudioFrame(
-                data=chunk_data, sample_rate=SAMPLE_RATE, 
-                num_channels=NUM_CHANNELS, samples_per_channel=FRAME_SIZE_SAMPLES
-            )
-            await self.source.capture_frame(lk_frame)
-            await asyncio.sleep(0.01)
-
-    async def _stream_from_disk(self, filename):
-        """Streams larger files from disk."""
-        try:
-            for chunk_data in self._decode_file(filename):
-                lk_frame = rtc.AudioFrame(
-                    data=chunk_data, sample_rate=SAMPLE_RATE, 
-                    num_channels=NUM_CHANNELS, samples_per_channel=FRAME_SIZE_SAMPLES
-                )
-                await self.source.capture_frame(lk_frame)
-                await asyncio.sleep(0.01)
-        except Exception as e:
-            print(f"Error streaming {filename}: {e}")
-
 class GrievanceBotLogic:
     def __init__(self):
         self.state = "greeting"
@@ -262,13 +175,17 @@ async def entrypoint(ctx: JobContext):
     print(f"Room created: {ctx.room.name}. Waiting for user...")
     await ctx.connect(auto_subscribe=AutoSubscribe.AUDIO_ONLY)
 
-    source = rtc.AudioSource(SAMPLE_RATE, NUM_CHANNELS)
+    # Pending grievance saves must finish before the job is torn down
+    ctx.add_shutdown_callback(flush_background_tasks)
+
+    # No internal queue: 10ms frames go straight to the publisher, paced by _send_frames
+    source = rtc.AudioSource(SAMPLE_RATE, NUM_CHANNELS, queue_size_ms=0)
     track = rtc.LocalAudioTrack.create_audio_track("bot_voice", source)
     await ctx.room.local_participant.publish_track(track)
     
     # Initialize player and preload
     player = AudioFilePlayer(source)
-    player.preload(AUDIO_FILES)
+    await asyncio.to_thread(player.preload, AUDIO_FILES)
 
     # Setup STT
     stt_provider = deepgram.STT(
@@ -283,13 +200,16 @@ async def entrypoint(ctx: JobContext):
 
     last_processed_transcript = ""
     
+    playback_task = None  # Strong reference to the prompt currently playing
+
     async def process_stt_events():
-        nonlocal last_processed_transcript
+        nonlocal last_processed_transcript, playback_task
         
         async for event in stt_stream:
             if event.type == stt.SpeechEventType.INTERIM_TRANSCRIPT:
                 if player.is_playing and len(event.alternatives[0].text) > 5:
                     print("[BARGE-IN] User speaking, stopping audio.")
+                    player.stop()
                 
             elif event.type == stt.SpeechEventType.FINAL_TRANSCRIPT:
                 transcript = event.alternatives[0].text
@@ -308,7 +228,8 @@ async def entrypoint(ctx: JobContext):
                         
                         # THEN start background save (after audio is playing/done)
                         print("[CLOSING] Starting background save...")
-                        asyncio.create_task(bot.save_grievance_background())
+                        # Tracked so the shutdown flush waits for it after disconnect
+                        spawn_background(bot.save_grievance_background())
                         
                         # Brief pause then disconnect
                         await asyncio.sleep(0.5)
@@ -316,8 +237,9 @@ async def entrypoint(ctx: JobContext):
                         await ctx.room.disconnect()
                         break
                     else:
-                        # Normal audio playback
-                        await player.play(AUDIO_FILES[audio_key])
+                        # Normal audio playback, off this loop so interims can still barge in
+                        # (play() itself cancels whatever prompt is still running)
+                        playback_task = asyncio.create_task(player.play(AUDIO_FILES[audio_key]))
     
     asyncio.create_task(process_stt_events())
 
@@ -329,12 +251,13 @@ async def entrypoint(ctx: JobContext):
     ):
         if track.kind == rtc.TrackKind.KIND_AUDIO:
             print(f"User joined: {participant.identity}")
+            # Unbounded: the uplink never parks, so a loop stall delays speech instead of dropping it
             audio_stream = rtc.AudioStream(track)
             
             async def push_audio_to_stt():
+                # Keeps flowing while a prompt plays: interim transcripts are what trigger barge-in
                 async for event in audio_stream:
-                    if not player.is_playing:
-                        stt_stream.push_frame(event.frame)
+                    stt_stream.push_frame(event.frame)
             
             asyncio.create_task(push_audio_to_stt())
             
@@ -2,7 +2,7 @@ import sqlite3
 import json
 import uuid
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Dict, Iterator, Optional
 import google.generativeai as genai
 import os
 
@@ -76,8 +76,9 @@ Respond strictly in JSON format:
 }}"""
 
         try:
-            # Generate content using Gemini
-            response = self.model.generate_content(
+            # Generate content using Gemini; the async call keeps the event loop
+            # (and the live call audio) free while the request is in flight
+            response = await self.model.generate_content_async(
                 prompt,
                 generation_config=genai.types.GenerationConfig(
                     response_mime_type="application/json"
@@ -158,6 +159,25 @@ Respond strictly in JSON format:
             **analysis
         }
     
+    def _row_to_dict(self, row) -> Dict:
+        """Convert a grievances table row into a dict."""
+        # Handle potential missing column if row is from very old schema version 
+        # (though _init_database handles the migration, this is extra safety)
+        location = row[9] if len(row) > 9 else "Undisclosed Location"
+        
+        return {
+            "id": row[0],
+            "timestamp": float(row[1]),
+            "transcript": row[2],
+            "category": row[3],
+            "priority": row[4],
+            "sentiment": row[5],
+            "summary": row[6],
+            "tags": json.loads(row[7]),
+            "created_at": row[8],
+            "location": location
+        }
+    
     def get_grievance(self, grievance_id: str) -> Optional[Dict]:
         """Retrieve a grievance by ID."""
         conn = sqlite3.connect(self.db_path)
@@ -168,54 +188,27 @@ Respond strictly in JSON format:
         conn.close()
         
         if row:
-            # Handle potential missing column if row is from very old schema version 
-            # (though _init_database handles the migration, this is extra safety)
-            location = row[9] if len(row) > 9 else "Undisclosed Location"
-            
-            return {
-                "id": row[0],
-                "timestamp": float(row[1]),
-                "transcript": row[2],
-                "category": row[3],
-                "priority": row[4],
-                "sentiment": row[5],
-                "summary": row[6],
-                "tags": json.loads(row[7]),
-                "created_at": row[8],
-                "location": location
-            }
+            return self._row_to_dict(row)
         return None
     
     def get_all_grievances(self, limit: int = 100) -> list:
         """Retrieve all grievances, most recent first."""
+        return list(self.iter_grievances(limit=limit))
+    
+    def iter_grievances(self, limit: int = 100) -> Iterator[Dict]:
+        """Yield grievances one at a time, most recent first, without loading them all."""
         conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT * FROM grievances 
-            ORDER BY timestamp DESC 
-            LIMIT ?
-        """, (limit,))
-        
-        rows = cursor.fetchall()
-        conn.close()
-        
-        results = []
-        for row in rows:
-            location = row[9] if len(row) > 9 else "Undisclosed Location"
-            results.append({
-                "id": row[0],
-                "timestamp": float(row[1]),
-                "transcript": row[2],
-                "category": row[3],
-                "priority": row[4],
-                "sentiment": row[5],
-                "summary": row[6],
-                "tags": json.loads(row[7]),
-                "created_at": row[8],
-                "location": location
-            })
-        return results
+        try:
+            cursor = conn.execute("""
+                SELECT * FROM grievances 
+                ORDER BY timestamp DESC 
+                LIMIT ?
+            """, (limit,))
+            
+            for row in cursor:
+                yield self._row_to_dict(row)
+        finally:
+            conn.close()
     
     def get_statistics(self) -> Dict:
         """Get summary statistics of all grievances."""
@@ -0,0 +1,8 @@
+import logging
+import os
+
+
+def env_log_level(default="INFO"):
+    """LOG_LEVEL from the environment, or the default if unset or not a level name."""
+    level = os.getenv("LOG_LEVEL", default).upper()
+    return level if isinstance(logging.getLevelName(level), int) else default
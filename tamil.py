@@ -1,7 +1,12 @@
 import asyncio
+import atexit
+import logging
+import logging.handlers
 import os
+import queue
 import sqlite3
 import uuid
+from collections import namedtuple
 from datetime import datetime
 from dotenv import load_dotenv
 
@@ -11,14 +16,36 @@ from livekit.agents import (
     Agent,
     AgentSession,
     JobContext,
+    JobProcess,
     WorkerOptions,
     cli,
     function_tool,
 )
 from livekit.plugins import sarvam, groq, silero
 
+from log_config import env_log_level
+
 load_dotenv()
 
+# --- Logging ---
+# Records go through a queue so the event loop never blocks on stderr writes;
+# a background listener thread does the actual I/O.
+def _setup_logging() -> logging.Logger:
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        log_queue, logging.StreamHandler(), respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
+
+    log = logging.getLogger("tamil")
+    log.setLevel(env_log_level())
+    log.addHandler(logging.handlers.QueueHandler(log_queue))
+    log.propagate = False  # The queue is the only path; the root handler would write twice
+    return log
+
+logger = _setup_logging()
+
 # --- Database Manager ---
 class DatabaseManager:
     def __init__(self, db_path="grievance.db"):
@@ -48,28 +75,25 @@ class DatabaseManager:
         conn.commit()
         conn.close()
 
-    def save_grievance(self, transcript: str):
-        """Save the transcript, generating ID and timestamps automatically."""
+    def save_grievance(self, record_id: str, started_at: str, transcript: str):
+        """Save the transcript under an ID and timestamp generated at call start."""
         if not transcript.strip():
-            print("[DB] Transcript is empty, skipping save.")
+            logger.info("[DB] Transcript is empty, skipping save.")
             return
 
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
 
-        record_id = str(uuid.uuid4())
-        current_time = datetime.now().isoformat()
-
         try:
             cursor.execute("""
                 INSERT INTO grievances (id, timestamp, transcript, created_at)
                 VALUES (?, ?, ?, ?)
-            """, (record_id, current_time, transcript, current_time))
+            """, (record_id, started_at, transcript, started_at))
             
             conn.commit()
-            print(f"[DB] Successfully saved grievance ID: {record_id}")
+            logger.info("[DB] Successfully saved grievance ID: %s", record_id)
         except Exception as e:
-            print(f"[DB] Error saving grievance: {e}")
+            logger.error("[DB] Error saving grievance: %s", e)
         finally:
             conn.close()
 
@@ -100,10 +124,17 @@ SYSTEM_INSTRUCTIONS = """நீங்கள் "HR Voice Assistant", ஒரு 
 நினைவில் கொள்ளுங்கள்: உங்கள் வேலை முழுமையான தகவலைச் சேகரிப்பது. பொறுமையாகவும் முழுமையாகவும் இருங்கள்."""
 
 
+# Conversation turn; a tuple is far smaller than a per-message dict
+Msg = namedtuple("Msg", "role content")
+
+
 class GrievanceTracker:
     """Track grievance conversation and manage call state."""
     
     def __init__(self):
+        # ID and timestamp are fixed at call start so the disconnect path only has to write
+        self.record_id = uuid.uuid4().hex
+        self.started_at = datetime.now().isoformat()
         self.grievance_text = []  # Tamil transcript
         self.conversation_history = []
         self.word_count = 0
@@ -111,13 +142,13 @@ class GrievanceTracker:
     def add_user_message(self, text: str):
         """Add user message in Tamil."""
         self.grievance_text.append(f"பணியாளர்: {text}")
-        self.conversation_history.append({"role": "user", "content": text})
+        self.conversation_history.append(Msg("user", text))
         self.word_count += len(text.split())
-        print(f"[USER MESSAGE] {text[:100]}...")
+        logger.debug("[USER MESSAGE] %.100s...", text)  # Truncated only if emitted
     
     def add_agent_message(self, text: str):
         """Add agent message to history."""
-        self.conversation_history.append({"role": "assistant", "content": text})
+        self.conversation_history.append(Msg("assistant", text))
     
     def get_full_grievance(self) -> str:
         """Get the complete grievance transcript in Tamil."""
@@ -127,15 +158,43 @@ class GrievanceTracker:
         """Get grievance statistics."""
         return {
             "total_messages": len(self.conversation_history),
-            "user_messages": len([m for m in self.conversation_history if m["role"] == "user"]),
+            "user_messages": sum(1 for m in self.conversation_history if m.role == "user"),
             "word_count": self.word_count,
         }
 
 
+def make_end_call(should_end_call: asyncio.Event):
+    """Build the end_call function tool bound to a per-call event."""
+    
+    @function_tool
+    async def end_call(
+        confirmation: str = "yes"
+    ):
+        """
+        பயனர் முடித்துவிட்டதாகக் குறிப்பிடும்போது அல்லது உரையாடல் முடிந்தவுடன் குறைதீர்ப்பு சேகரிப்பு அழைப்பை முடிக்கவும்.
+        
+        Args:
+            confirmation: அழைப்பை முடிக்க உறுதிப்படுத்தல் (இயல்புநிலை: "yes")
+        """
+        logger.info("[FUNCTION] end_call function invoked by LLM")
+        should_end_call.set()
+        return "அழைப்பு முடிவடைதல் தொடங்கப்பட்டது. குறைதீர்ப்பு பதிவு செய்யப்பட்டுள்ளது."
+    
+    return end_call
+
+
+def prewarm(proc: JobProcess):
+    """Load the VAD model once per worker process, before any job is assigned."""
+    proc.userdata["vad"] = silero.VAD.load(
+        min_speech_duration=0.3,
+        min_silence_duration=0.8,
+    )
+
+
 async def entrypoint(ctx: JobContext):
     """Main entrypoint for the voice agent."""
     
-    print(f"[ROOM] Connecting to room: {ctx.room.name}")
+    logger.info("[ROOM] Connecting to room: %s", ctx.room.name)
     
     # Initialize Database
     db_manager = DatabaseManager()
@@ -149,33 +208,15 @@ async def entrypoint(ctx: JobContext):
     # Flag to track if call should end
     should_end_call = asyncio.Event()
     
-    # Define the end_call function tool
-    @function_tool
-    async def end_call(
-        confirmation: str = "yes"
-    ):
-        """
-        பயனர் முடித்துவிட்டதாகக் குறிப்பிடும்போது அல்லது உரையாடல் முடிந்தவுடன் குறைதீர்ப்பு சேகரிப்பு அழைப்பை முடிக்கவும்.
-        
-        Args:
-            confirmation: அழைப்பை முடிக்க உறுதிப்படுத்தல் (இயல்புநிலை: "yes")
-        """
-        print("[FUNCTION] end_call function invoked by LLM")
-        should_end_call.set()
-        return "அழைப்பு முடிவடைதல் தொடங்கப்பட்டது. குறைதீர்ப்பு பதிவு செய்யப்பட்டுள்ளது."
-    
     # Create the agent with Tamil instructions
     agent = Agent(
         instructions=SYSTEM_INSTRUCTIONS,
-        tools=[end_call],
+        tools=[make_end_call(should_end_call)],
     )
     
     # Create agent session with Tamil language support
     session = AgentSession(
-        vad=silero.VAD.load(
-            min_speech_duration=0.3,
-            min_silence_duration=0.8,
-        ),
+        vad=ctx.proc.userdata["vad"],
         stt=groq.STT(
             model="whisper-large-v3-turbo",
             language="ta",
@@ -200,38 +241,40 @@ async def entrypoint(ctx: JobContext):
             # User message in Tamil
             text = item.text_content or ""
             if text:
-                print(f"\n[USER - தமிழ்] {text}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("[USER - தமிழ்] %s", text)
                 grievance_tracker.add_user_message(text)
         elif item.role == "assistant":
             # Agent message
             text = item.text_content or ""
             if text and not item.interrupted:
-                print(f"[AGENT - தமிழ்] {text}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("[AGENT - தமிழ்] %s", text)
                 grievance_tracker.add_agent_message(text)
     
     @session.on("function_calls_finished")
     def on_function_calls_finished(called_functions):
         """Called when LLM finishes executing function calls."""
         for func in called_functions:
-            print(f"[FUNCTION] Completed: {func.call_info.function_info.name}")
+            logger.debug("[FUNCTION] Completed: %s", func.call_info.function_info.name)
     
-    print("[SESSION] Starting agent session...")
+    logger.info("[SESSION] Starting agent session...")
     
     # Start the session as a background task
     session_task = asyncio.create_task(session.start(agent=agent, room=ctx.room))
     
-    print("[SESSION] Waiting for participant to join...")
+    logger.info("[SESSION] Waiting for participant to join...")
     
     # Wait for participant to join
     while len(ctx.room.remote_participants) == 0:
         await asyncio.sleep(0.1)
     
-    print("[SESSION] Participant joined. Waiting for session to initialize...")
+    logger.info("[SESSION] Participant joined. Waiting for session to initialize...")
     
     # Wait for session to be ready
     await asyncio.sleep(1.5)
     
-    print("[SESSION] Sending initial greeting...")
+    logger.info("[SESSION] Sending initial greeting...")
     
     # Send initial greeting in Tamil
     try:
@@ -239,20 +282,20 @@ async def entrypoint(ctx: JobContext):
             instructions="சுருக்கமான, அன்பான வரவேற்பு கொடுத்து அவர்களின் குறைதீர்ப்பைப் பகிர்ந்து கொள்ளச் சொல்லுங்கள். ஒரே ஒரு வாக்கியம் மட்டும்."
         )
     except Exception as e:
-        print(f"[ERROR] Failed to generate greeting: {e}")
+        logger.error("[ERROR] Failed to generate greeting: %s", e)
     
-    print("[AGENT] Ready to collect grievances in Tamil...")
+    logger.info("[AGENT] Ready to collect grievances in Tamil...")
     
     try:
         # Wait only for the end_call signal
         await should_end_call.wait()
         
-        print("[CLOSING] end_call triggered. Waiting for final message...")
+        logger.info("[CLOSING] end_call triggered. Waiting for final message...")
         
         # Give enough time for the final message to be generated and spoken
         await asyncio.sleep(6.5)
         
-        print("[CLOSING] Proceeding with disconnect")
+        logger.info("[CLOSING] Proceeding with disconnect")
         
         # Now cancel the session
         session_task.cancel()
@@ -262,7 +305,7 @@ async def entrypoint(ctx: JobContext):
             pass
         
     except asyncio.CancelledError:
-        print("[SESSION] Session cancelled")
+        logger.info("[SESSION] Session cancelled")
         session_task.cancel()
         try:
             await session_task
@@ -273,24 +316,22 @@ async def entrypoint(ctx: JobContext):
         stats = grievance_tracker.get_stats()
         full_grievance = grievance_tracker.get_full_grievance()
         
-        print("\n" + "="*70)
-        print("[GRIEVANCE COLLECTION COMPLETE]")
-        print("="*70)
-        print(f"Total Messages: {stats['total_messages']}")
-        print(f"User Messages: {stats['user_messages']}")
-        print(f"Word Count: {stats['word_count']}")
-        print("-"*70)
-        print("[TAMIL TRANSCRIPT]")
-        print(full_grievance)
-        print("="*70 + "\n")
+        logger.info(
+            "[GRIEVANCE COLLECTION COMPLETE] Total Messages: %d | User Messages: %d | Word Count: %d",
+            stats['total_messages'], stats['user_messages'], stats['word_count'],
+        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[TAMIL TRANSCRIPT]\n%s", full_grievance)
         
         # Save Tamil transcript to database
-        print("[DB] Saving Tamil transcript to database...")
-        db_manager.save_grievance(full_grievance)
+        logger.info("[DB] Saving Tamil transcript to database...")
+        db_manager.save_grievance(
+            grievance_tracker.record_id, grievance_tracker.started_at, full_grievance
+        )
         
-        print("[DISCONNECT] Closing connection...")
+        logger.info("[DISCONNECT] Closing connection...")
         await ctx.room.disconnect()
-        print("[SESSION] Session ended")
+        logger.info("[SESSION] Session ended")
 
 
 if __name__ == "__main__":
@@ -298,5 +339,6 @@ if __name__ == "__main__":
     cli.run_app(
         WorkerOptions(
             entrypoint_fnc=entrypoint,
+            prewarm_fnc=prewarm,
         )
     )
\ No newline at end of file
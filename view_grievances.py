@@ -5,7 +5,7 @@ Usage: python view_grievances.py [command]
 """
 
 import sys
-import json
+import orjson
 from grievance_processor import GrievanceProcessor
 from datetime import datetime
 
@@ -89,12 +89,18 @@ def main():
         # Export all grievances to JSON
         output_file = sys.argv[2] if len(sys.argv) > 2 else "grievances_export.json"
         
-        grievances = processor.get_all_grievances(limit=10000)
+        # Stream rows straight to disk so memory stays flat regardless of row count.
+        # Each row is indented one level deeper, matching OPT_INDENT_2 on the whole list.
+        count = 0
+        with open(output_file, 'wb') as f:
+            f.write(b"[")
+            for grievance in processor.iter_grievances(limit=10000):
+                f.write(b",\n  " if count else b"\n  ")
+                f.write(orjson.dumps(grievance, option=orjson.OPT_INDENT_2).replace(b"\n", b"\n  "))
+                count += 1
+            f.write(b"\n]" if count else b"]")
         
-        with open(output_file, 'w') as f:
-            json.dump(grievances, f, indent=2)
-        
-        print(f"✅ Exported {len(grievances)} grievances to {output_file}")
+        print(f"✅ Exported {count} grievances to {output_file}")
     
     elif command == "help":
         print("""
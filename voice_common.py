@@ -0,0 +1,312 @@
+import asyncio
+import mmap
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import av
+import logging
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from livekit import rtc
+
+from log_config import env_log_level
+
+# Module logger: INFO by default for call lifecycle lines; per-utterance traces are DEBUG.
+# Propagates to the root handler the livekit CLI installs, so it shares livekit's log format.
+logger = logging.getLogger("grievance")
+logger.setLevel(env_log_level())
+
+# --- CONFIGURATION ---
+AUDIO_FILES = {
+    "greeting": "audio/greeting_new.mp3",
+    "closing": "audio/closing_new.mp3",
+    "early_exit": "audio/early_closing.mp3",
+    "probe_details": "audio/probe_details_short.mp3", # Your long "Thank you for sharing..." script
+    "ack_1": "audio/hmm.mp3",              # Short sound (0.5s)
+    "ack_2": "audio/i_see.mp3",            # Short sound (0.5s)
+    "ack_3": "audio/ohh_isit.mp3"             # Short sound (0.5s)
+}
+
+SAMPLE_RATE = 48000
+NUM_CHANNELS = 1
+FRAME_SIZE_SAMPLES = 480
+BYTES_PER_SAMPLE = 2
+FRAME_SIZE_BYTES = FRAME_SIZE_SAMPLES * NUM_CHANNELS * BYTES_PER_SAMPLE
+FRAME_DURATION = FRAME_SIZE_SAMPLES / SAMPLE_RATE  # 10ms
+PRIME_FRAMES = 3  # Frames sent back-to-back at prompt start to get audio flowing immediately
+FFMPEG_PATH = shutil.which("ffmpeg")
+PCM_SIDECAR_EXT = ".s16"  # Decoded 48kHz mono s16le kept next to each source file
+
+# Strong references to fire-and-forget tasks so they can't be garbage collected mid-flight
+_BG_TASKS = set()
+
+def spawn_background(coro):
+    """Schedule a background task and keep it alive until it finishes."""
+    task = asyncio.create_task(coro)
+    _BG_TASKS.add(task)
+    task.add_done_callback(_BG_TASKS.discard)
+    return task
+
+async def flush_background_tasks():
+    """Shutdown callback: let pending grievance processing finish before the job is torn down."""
+    if _BG_TASKS:
+        logger.info("[SHUTDOWN] Waiting for %d background task(s)...", len(_BG_TASKS))
+        await asyncio.gather(*_BG_TASKS, return_exceptions=True)
+
+# Decoded prompts shared by every player in this worker process
+_FRAME_CACHE = {}
+# PyAV resamplers (one per input format) shared the same way, and the lock guarding them
+_RESAMPLERS = {}
+_PYAV_LOCK = threading.Lock()
+
+class AudioFilePlayer:
+    def __init__(self, source: rtc.AudioSource):
+        self.source = source
+        self._current_task = None
+        self.is_playing = False
+        self._cache = _FRAME_CACHE  # Ready-to-send AudioFrames, decoded once per process
+        self._resamplers = _RESAMPLERS  # One resampler per input format, reused across files and players
+        self._scratch = np.empty(SAMPLE_RATE, dtype=np.int16)  # Decode scratch (1s), reused across files
+        self._pyav_lock = _PYAV_LOCK  # Guards the resamplers and scratch across decode threads
+
+    def preload(self, files_dict):
+        """Pre-decode every audio file not already cached into AudioFrames held in memory."""
+        paths = [path for path in files_dict.values() if path not in self._cache]
+        if not paths:
+            return
+        logger.info("[INIT] Pre-loading audio files...")
+        # ffmpeg decodes run in separate processes, so they parallelise cleanly;
+        # the PyAV fallback shares resamplers and must stay serial.
+        max_workers = min(4, len(paths)) if FFMPEG_PATH else 1
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self._decode_to_frames, path): path
+                for path in paths
+            }
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    self._cache[path] = future.result()
+                    logger.info("   -> Cached %s", path)
+                except Exception as e:
+                    # Falls back to decoding from disk on playback
+                    logger.warning("   -> Failed to cache %s: %s", path, e)
+
+    def _decode_to_frames(self, filename) -> list:
+        """Decode a file into the list of AudioFrames stored in the cache."""
+        sidecar = os.path.splitext(filename)[0] + PCM_SIDECAR_EXT
+        mapped = self._map_sidecar(filename, sidecar)
+        if mapped is not None:
+            with mapped:
+                return self._pcm_to_frames(mapped)
+
+        pcm = self._decode_to_pcm(filename)
+        self._write_sidecar(sidecar, pcm)
+        return self._pcm_to_frames(pcm)
+
+    @staticmethod
+    def _map_sidecar(filename, sidecar):
+        """Memory-map an up-to-date PCM sidecar, or return None if it must be rebuilt."""
+        try:
+            if os.path.getmtime(sidecar) < os.path.getmtime(filename):
+                return None
+            with open(sidecar, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):  # Missing, unreadable or empty sidecar
+            return None
+        if len(mm) % FRAME_SIZE_BYTES:
+            mm.close()
+            return None
+        if hasattr(mm, "madvise"):
+            mm.madvise(mmap.MADV_WILLNEED)
+        return mm
+
+    @staticmethod
+    def _write_sidecar(sidecar, pcm: bytes):
+        """Persist decoded PCM so later start-ups can skip decoding entirely."""
+        # Unique temp name: prewarmed worker processes may all write the same sidecar at once
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(sidecar) or ".", prefix=os.path.splitext(os.path.basename(sidecar))[0] + ".", suffix=PCM_SIDECAR_EXT + ".tmp"
+            )
+            with os.fdopen(fd, "wb") as f:
+                f.write(pcm)
+            os.replace(tmp_path, sidecar)
+        except OSError as e:
+            logger.warning("   -> Could not write %s: %s", sidecar, e)
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    def _decode_to_pcm(self, filename) -> bytes:
+        """Transcode a file once to 48kHz mono s16le, padded to whole frames."""
+        if FFMPEG_PATH:
+            pcm = self._decode_with_ffmpeg(filename)
+        else:
+            pcm = bytearray()
+            with self._pyav_lock:
+                for chunk in self._decode_file(filename):
+                    pcm.extend(chunk)
+            pcm = bytes(pcm)
+        tail = len(pcm) % FRAME_SIZE_BYTES
+        if tail:
+            pcm += bytes(FRAME_SIZE_BYTES - tail)
+        return pcm
+
+    @staticmethod
+    def _decode_with_ffmpeg(filename) -> bytes:
+        """Decode via an ffmpeg subprocess; much faster than PyAV for whole files."""
+        proc = subprocess.Popen(
+            [
+                FFMPEG_PATH, "-v", "quiet", "-i", filename,
+                "-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", str(NUM_CHANNELS), "pipe:1",
+            ],
+            stdout=subprocess.PIPE,
+            bufsize=1 << 20,
+        )
+        pcm, _ = proc.communicate()
+        if proc.returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with code {proc.returncode}")
+        return pcm
+
+    @staticmethod
+    def _pcm_to_frames(pcm: bytes) -> list:
+        """Split a PCM buffer into 10ms AudioFrames, built once and reused on every playback."""
+        # AudioFrame copies its data, so the view can be released straight away
+        with memoryview(pcm) as view:
+            return [
+                rtc.AudioFrame(
+                    data=view[offset:offset + FRAME_SIZE_BYTES], sample_rate=SAMPLE_RATE, num_channels=NUM_CHANNELS, samples_per_channel=FRAME_SIZE_SAMPLES
+                )
+                for offset in range(0, len(view), FRAME_SIZE_BYTES)
+            ]
+
+    async def play(self, filename: str):
+        # 1. Stop current audio (Handle interruption)
+        if self._current_task and not self._current_task.done():
+            self._current_task.cancel()
+            try:
+                await self._current_task
+            except asyncio.CancelledError:
+                pass
+
+        self.is_playing = True
+        
+        # 2. Check Cache
+        if filename in self._cache:
+            task = asyncio.create_task(self._stream_cached(filename))
+        else:
+            task = asyncio.create_task(self._stream_from_disk(filename))
+        self._current_task = task
+            
+        # 3. Wait without re-raising when stop() cancels the stream (barge-in)
+        try:
+            await asyncio.wait((task,))
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+
+        # A newer play() owns the state if it replaced our task
+        if self._current_task is task:
+            self.is_playing = False
+
+    def stop(self):
+        """Barge-in: cancel the current stream and drop audio already queued in the source."""
+        if self._current_task and not self._current_task.done():
+            self._current_task.cancel()
+            self.source.clear_queue()
+
+    async def wait_for_playout(self):
+        """Wait until every captured frame has actually been played out."""
+        await self.source.wait_for_playout()
+
+    def _get_resampler(self, stream):
+        """Return the resampler for this input format, building it on first use."""
+        # A PyAV resampler is locked to the format of the first frame it sees
+        key = (stream.format.name, stream.layout.name, stream.rate)
+        resampler = self._resamplers.get(key)
+        if resampler is None:
+            resampler = av.AudioResampler(format="s16", layout="mono", rate=SAMPLE_RATE)
+            self._resamplers[key] = resampler
+        return resampler
+
+    def _decode_file(self, filename):
+        """Generator that yields 10ms PCM chunks from a file.
+
+        Chunks are memoryviews into a reused scratch buffer: consume (copy)
+        each one before advancing the generator.
+        """
+        container = None
+        try:
+            container = av.open(filename)
+            stream = container.streams.audio[0]
+            resampler = self._get_resampler(stream)
+            scratch = self._scratch
+            window = memoryview(scratch)  # Sliced per chunk without allocating an ndarray view
+            read_idx = write_idx = 0  # Cursors into the scratch buffer, in samples
+            chunk = FRAME_SIZE_SAMPLES * NUM_CHANNELS
+        
+            for frame in container.decode(stream):
+                for resampled_frame in resampler.resample(frame):
+                    # s16 mono is packed in plane 0; count trims the plane's alignment padding
+                    samples = np.frombuffer(
+                        resampled_frame.planes[0], dtype=np.int16, count=resampled_frame.samples * NUM_CHANNELS
+                    )
+                    if write_idx + len(samples) > len(scratch):
+                        # Move the unread tail to the front, growing only if it still won't fit
+                        pending = write_idx - read_idx
+                        if pending + len(samples) > len(scratch):
+                            grown = np.empty(2 * (pending + len(samples)), dtype=np.int16)
+                            grown[:pending] = scratch[read_idx:write_idx]
+                            scratch = self._scratch = grown
+                            window = memoryview(scratch)
+                        else:
+                            scratch[:pending] = scratch[read_idx:write_idx]
+                        read_idx, write_idx = 0, pending
+                    np.copyto(scratch[write_idx:write_idx + len(samples)], samples)
+                    write_idx += len(samples)
+                    while write_idx - read_idx >= chunk:
+                        yield window[read_idx:read_idx + chunk]
+                        read_idx += chunk
+                    if read_idx == write_idx:
+                        read_idx = write_idx = 0
+        finally:
+            if container is not None:
+                container.close()
+
+    async def _stream_cached(self, filename):
+        """Streams pre-built frames from memory (Zero Latency)."""
+        await self._send_frames(self._cache[filename])
+
+    async def _stream_from_disk(self, filename):
+        """Decodes a file that missed preload off the event loop, caches it, then streams it."""
+        try:
+            frames = await asyncio.to_thread(self._decode_to_frames, filename)
+        except Exception as e:
+            logger.error("Error streaming %s: %s", filename, e)
+            return
+        self._cache[filename] = frames
+        await self._send_frames(frames)
+
+    async def _send_frames(self, frames):
+        """Capture frames in real time against an absolute clock.
+
+        Sleeping until each frame's deadline (rather than a fixed 10ms after it)
+        means a slow capture_frame doesn't stretch playback, and a fast one
+        doesn't pay the full tick. The clock starts PRIME_FRAMES behind, so the
+        first frames go out unpaced and playback keeps that small lead.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() - PRIME_FRAMES * FRAME_DURATION
+        for lk_frame in frames:
+            await self.source.capture_frame(lk_frame)
+            deadline += FRAME_DURATION
+            delay = deadline - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)